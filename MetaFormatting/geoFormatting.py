@@ -9,19 +9,25 @@ import numpy as np
 
 # --- Convert pixel location to map location ---
 # Pixels to map coordinates
+#  accepts scalars or arrays of pixel locations
 def px2coords(tnsf,px,py):
 	left=tnsf[0]; dx=tnsf[1]
 	top=tnsf[3]; dy=tnsf[5]
-	xcoord=left+px*dx
-	ycoord=top+py*dy
+	xcoord=left+np.asarray(px)*dx
+	ycoord=top+np.asarray(py)*dy
+	if xcoord.ndim==0: xcoord=xcoord.item()
+	if ycoord.ndim==0: ycoord=ycoord.item()
 	return xcoord, ycoord
 
 # Map coordinates to pixels
+#  accepts scalars or arrays of coordinates; truncates like int()
 def coords2px(tnsf,lon,lat):
 	left=tnsf[0]; dx=tnsf[1]
 	top=tnsf[3]; dy=tnsf[5]
-	px=int((lon-left)/dx)
-	py=int((top-lat)/dy)
+	px=((np.asarray(lon)-left)/dx).astype(np.intp,copy=False)
+	py=((top-np.asarray(lat))/dy).astype(np.intp,copy=False)
+	if px.ndim==0: px=px.item()
+	if py.ndim==0: py=py.item()
 	return px,py
 
 
@@ -52,10 +58,10 @@ class GDALtransform:
 		self.xstep=transform[1]
 		self.xend=self.xstart+shape[1]*self.xstep 
 		self.yend=self.ystart+shape[0]*self.ystep 
-		self.ymin=np.min([self.yend,self.ystart])
-		self.ymax=np.max([self.yend,self.ystart])
-		self.xmin=np.min([self.xend,self.xstart])
-		self.xmax=np.max([self.xend,self.xstart]) 
+		self.ymin=min(self.yend,self.ystart)
+		self.ymax=max(self.yend,self.ystart)
+		self.xmin=min(self.xend,self.xstart)
+		self.xmax=max(self.xend,self.xstart) 
 		self.extent=[self.xmin,self.xmax,self.ymin,self.ymax] 
 		self.bounds=[self.xmin,self.ymin,self.xmax,self.ymax] 
 		# Print outputs? 
@@ -8,14 +8,24 @@ Plot GDAL-compatible map data sets, including complex images and multi-band
 import argparse
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.stats import mode
-from scipy.interpolate import interp1d
 from osgeo import gdal
+from kernelFunctions import maskBackground, histogramCounts, valuePercentiles
 
 
 ### PARSER ---
+_PARSER = None
+
 def createParser():
+    '''
+    Return the argument parser, building it only on the first call.
+    '''
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = _buildParser()
+
+    return _PARSER
+
+def _buildParser():
     Description = '''Plot GDAL-compatible map data sets, including complex
 images and multi-band data sets.'''
 
@@ -27,7 +37,8 @@ images and multi-band data sets.'''
     inputArgs.add_argument(dest='imgFile', type=str, 
         help='File to plot')
     inputArgs.add_argument('-i','--image-type', dest='imgType', type=str, default='auto',
-        help='Image type ([auto], ISCE/complex)')
+        help='Image type ([auto], ISCE/complex: two-band amplitude/phase file)\n'
+        'Single complex bands are detected automatically and shown as phase')
     inputArgs.add_argument('-b','--band', dest='imgBand', type=int, default=1,
         help='Image band')
     inputArgs.add_argument('-bg','--background', dest='background', nargs='+', 
@@ -36,7 +47,8 @@ images and multi-band data sets.'''
     # Display arguments
     displayArgs = parser.add_argument_group('DISPLAY ARGUMENTS')
     displayArgs.add_argument('-ds','--downsample-factor', dest='dfactor', type=int, default=0,
-        help='Downsample factor')
+        help='Downsample factor (data are read at 1/2**ds resolution;\n'
+        'stats, percentiles, histogram and auto background use the downsampled pixels)')
     displayArgs.add_argument('-c','--cmap', dest='cmap', type=str, default='viridis',
         help='Colormap')
     displayArgs.add_argument('-co','--cbar-orient', dest='cOrient', type=str,
@@ -81,10 +93,14 @@ class mapShow:
     '''
 
     ## Load and format
-    def __init__(self, imgFile, imgType, imgBand, background, verbose):
+    def __init__(self, imgFile, imgType, imgBand, background, verbose, dfactor=0):
         '''
         Instantiate object: Store parameters; Load map data; Conduct 
          behind-the-scenes formatting.
+        The downsample factor (2**dfactor) is applied when reading the data,
+         so GDAL only reads the pixels that will be displayed. All statistics
+         (min/max, percentiles, histogram, auto background) are therefore
+         computed from the downsampled pixels.
         '''
         # Record parameters
         self.imgFile = os.path.abspath(imgFile)
@@ -92,6 +108,7 @@ class mapShow:
         self.imgBand = imgBand
         self.background = background
         self.verbose = verbose
+        self.ds = int(2**dfactor)
 
         # Load and format data
         self.__loadData__()
@@ -115,36 +132,87 @@ class mapShow:
         # Load data
         self.DS = gdal.Open(self.imgFile, gdal.GA_ReadOnly)
 
+        # Raster properties, queried from GDAL once
+        self.M, self.N = self.DS.RasterYSize, self.DS.RasterXSize
+        self.nBands = self.DS.RasterCount
+        self.tnsf = self.DS.GetGeoTransform()
+
+        # Downsampled size
+        self.m = max(1, self.M//self.ds)
+        self.n = max(1, self.N//self.ds)
+
+        # Full-resolution window covered by the downsampled pixels
+        #  (clamped, in case the factor exceeds the raster size)
+        self.winM = min(self.m*self.ds, self.M)
+        self.winN = min(self.n*self.ds, self.N)
+
         # Image type
-        if self.imgType in 'ISCE, complex':
-            self.amp = self.DS.GetRasterBand(1).ReadAsArray()
-            self.phs = self.DS.GetRasterBand(2).ReadAsArray()
+        if self.imgType in ['ISCE', 'complex']:
+            self.amp = self.__readBand__(1)
+            self.phs = self.__readBand__(2)
+            self.img = self.phs
 
             if self.verbose == True:
                 print('Loaded complex image.\nBand 1: Amplitude\nBand 2: Phase')
         else:
-            self.img = self.DS.GetRasterBand(self.imgBand).ReadAsArray()
+            self.img = self.__readBand__(self.imgBand)
+
+            # Complex bands are detected from the array type (no pixel access)
+            if np.iscomplexobj(self.img):
+                self.__splitComplex__(self.img)
 
             if self.verbose == True: 
-                print('Loaded band: {:d} / {:d}'.format(self.imgBand, self.DS.RasterCount))
+                print('Loaded band: {:d} / {:d} ({})'.format(self.imgBand, self.nBands,
+                    'complex - showing phase' if hasattr(self, 'phs') else 'real'))
 
-        self.imgSize = np.prod(self.img.shape)
+        self.imgSize = self.img.size
 
         # Format geographic extent
         self.__formatGeographic__()
 
+    def __readBand__(self, bandNb):
+        '''
+        Read a single band at the downsampled resolution.
+        Only the window covered by whole downsampled pixels is read, and GDAL
+         picks every ds-th pixel (nearest neighbor) rather than reading the
+         full-resolution array.
+        Data are read in single precision (complex64 for complex bands), which
+         is ample for display and halves the memory traffic of later steps.
+        Called automatically by __loadData__.
+        '''
+        band = self.DS.GetRasterBand(bandNb)
+
+        if gdal.DataTypeIsComplex(band.DataType):
+            bufType = gdal.GDT_CFloat32
+        else:
+            bufType = gdal.GDT_Float32
+
+        return band.ReadAsArray(win_xsize=self.winN, win_ysize=self.winM,
+            buf_xsize=self.n, buf_ysize=self.m, buf_type=bufType,
+            resample_alg=gdal.GRIORA_NearestNeighbour)
+
+    def __splitComplex__(self, cpx):
+        '''
+        Split a complex image into amplitude and phase, and display the phase.
+        Each is computed in one pass over the array, in the single-precision
+         type matching complex64 inputs.
+        Called automatically by __loadData__.
+        '''
+        self.amp = np.abs(cpx)
+        self.phs = np.angle(cpx)
+        self.img = self.phs
+
     def __formatGeographic__(self):
         '''
         Format the geographic extent of an image for plotting purposes.
         Called automatically by __loadData__.
         '''
         # Basic parameters
-        M, N = self.DS.RasterYSize, self.DS.RasterXSize
-        [xmin, dx, xshear, ymax, yshear, dy] = self.DS.GetGeoTransform()
+        [xmin, dx, xshear, ymax, yshear, dy] = self.tnsf
 
-        # Fill in the rest
-        xmax = xmin + N*dx
-        ymin = ymax + M*dy
+        # Fill in the rest, based on the downsampled image size
+        xmax = xmin + self.winN*dx
+        ymin = ymax + self.winM*dy
 
         # Format extent
         self.extent = (xmin, xmax, ymin, ymax)
@@ -161,7 +229,6 @@ class mapShow:
         Called automatically by __init__.
         '''
         if self.verbose == True: print('BACKGROUND VALUE(S):')
-        mask = np.ones(self.img.shape)
 
         # Mask by background value(s)
         if self.background is not None:
@@ -187,17 +254,18 @@ class mapShow:
                     pct = np.sum(self.img==val)/self.img.size
                     print('\tValue: {:d} composes {:.1f} %'.format(n, pct))
 
-            # Mask by background value
-            mask[np.isnan(self.img) == 1] = 0
-            for n,val in enumerate(BGvals):
-                mask[self.img == val] = 0
+            # Mask NaNs and background values
+            self.img = maskBackground(self.img, BGvals)
 
         # If no background values specified
         else:
             if self.verbose == True: print('None')
 
-        # Apply mask
-        self.img = np.ma.array(self.img, mask=(mask==0))
+            # Nothing masked - no mask array is allocated
+            self.img = np.ma.array(self.img)
+
+        # Valid (non-masked) values as a flat array, shared by the stats
+        self.imgValues = self.img.compressed()
 
 
     def __detectBackground__(self,img):
@@ -208,7 +276,14 @@ class mapShow:
         '''
         # Edge values
         edgeValues = np.concatenate([img[0,:], img[-1,:], img[:,0], img[:,-1]])
-        autoBG = mode(edgeValues).mode[0]
+
+        # NaNs are masked anyway; take the most common remaining value
+        edgeValues = edgeValues[~np.isnan(edgeValues)]
+        if edgeValues.size == 0:
+            autoBG = np.nan
+        else:
+            vals, counts = np.unique(edgeValues, return_counts=True)
+            autoBG = vals[counts.argmax()]
 
         return autoBG
 
@@ -219,10 +294,14 @@ class mapShow:
         Called automatically by __init__.
         '''
         # Compute statistics
-        self.mean = self.img.compressed().flatten().mean()
-        self.median = np.median(self.img.compressed().flatten())
-        self.min = self.img.compressed().flatten().min()
-        self.max = self.img.compressed().flatten().max()
+        #  (mean and median are only computed on request - see properties)
+        self._mean = None
+        self._median = None
+        self.min = self.imgValues.min()
+        self.max = self.imgValues.max()
+
+        # Histogram range
+        self.histRange = (self.min, self.max)
 
         # Report if requested
         if self.verbose == True:
@@ -234,8 +313,35 @@ class mapShow:
             print('Max: {:.3e}'.format(self.max))
 
 
+    @property
+    def mean(self):
+        '''
+        Mean of the valid image values, computed on first access.
+        '''
+        if self._mean is None: self._mean = self.imgValues.mean()
+
+        return self._mean
+
+    @mean.setter
+    def mean(self, value):
+        self._mean = value
+
+    @property
+    def median(self):
+        '''
+        Median of the valid image values, computed on first access.
+        '''
+        if self._median is None: self._median = np.median(self.imgValues)
+
+        return self._median
+
+    @median.setter
+    def median(self, value):
+        self._median = value
+
+
     ## Plot
-    def plotImg(self, dfactor, cmap, cOrient, vmin, vmax, pctmin, pctmax, equalize):
+    def plotImg(self, cmap, cOrient, vmin, vmax, pctmin, pctmax, equalize):
         '''
         Plot formatted image.
         '''
@@ -245,12 +351,12 @@ class mapShow:
         # Equalize colors if specified
         if equalize == True: self.__equalize__()
 
-        # Spawn figure
+        # Spawn figure (matplotlib is imported only once plotting starts)
+        import matplotlib.pyplot as plt
         self.Fig, self.imgAx = plt.subplots()
 
-        # Plot image
-        ds = int(2**dfactor)
-        cImg = self.imgAx.imshow(self.img[::ds,::ds],
+        # Plot image (already downsampled on load)
+        cImg = self.imgAx.imshow(self.img,
             cmap = cmap, vmin = self.vmin, vmax = self.vmax,
             extent = self.extent)
 
@@ -268,15 +374,18 @@ class mapShow:
         self.vmax = self.max
 
         # Check for specified values
-        if vmin: self.vmin = vmin
-        if vmax: self.vmax = vmax
+        if vmin is not None: self.vmin = vmin
+        if vmax is not None: self.vmax = vmax
+
+        # Compute requested percentiles in a single pass
+        if pctmin is not None or pctmax is not None:
+            pctVals = valuePercentiles(self.imgValues,
+                [pctmin if pctmin is not None else 0,
+                 pctmax if pctmax is not None else 100],
+                self.min, self.max)
 
-        if pctmin:
-            pctmin = np.percentile(self.img.compressed().flatten(), pctmin)
-            self.vmin = np.max([self.vmin, pctmin])
-        if pctmax:
-            pctmax = np.percentile(self.img.compressed().flatten(), pctmax)
-            self.vmax = np.min([self.vmax, pctmax])
+            if pctmin is not None: self.vmin = max(self.vmin, pctVals[0])
+            if pctmax is not None: self.vmax = min(self.vmax, pctVals[1])
 
         # Report min/max value
         if self.verbose == True:
@@ -289,32 +398,43 @@ class mapShow:
         # Store mask for later
         mask = self.img.mask
 
+        # Fix mean/median of the original values before they are replaced
+        self.mean, self.median = self.mean, self.median
+
         # Compute histogram
         hcenters, hvals = self.__computeHistogram__()
         hcenters[0], hcenters[-1] = (self.min, self.max)
 
         # Integrate to build transform
-        hvals = hvals/len(self.img.compressed())
+        hvals = hvals/self.imgValues.size
         Hvals = np.cumsum(hvals)
         Hvals[0], Hvals[-1] = (0, 1)
 
         # Inverse interpolation
+        from scipy.interpolate import interp1d
         I = interp1d(hcenters, Hvals, bounds_error=False)
 
         # Re-mask image
         self.img = I(self.img.data)
         self.img = np.ma.array(self.img, mask=mask)
+        self.imgValues = self.img.compressed()
 
         # Replace min/max values
         self.vmin, self.vmax = (0, 1)
+        self.histRange = (0, 1)
 
     def __computeHistogram__(self):
         '''
         Compute a histogram based on the non-masked image values.
         '''
         # Compute histogram
-        hvals, hedges = np.histogram(self.img.compressed().flatten(), bins=128)
-        hcenters = (hedges[:-1]+hedges[1:])/2
+        nbins = 128
+        hmin, hmax = self.histRange
+        hvals = histogramCounts(self.imgValues, hmin, hmax, nbins)
+
+        # Bins are uniform, so centers follow directly from the range
+        width = (hmax - hmin)/nbins
+        hcenters = hmin + (np.arange(nbins) + 0.5)*width
 
         return hcenters, hvals
 
@@ -327,6 +447,7 @@ class mapShow:
         hcenters, hvals = self.__computeHistogram__()
 
         # Spawn figure
+        import matplotlib.pyplot as plt
         Hist, histAx = plt.subplots()
 
         # Plot histogram
@@ -364,12 +485,17 @@ if __name__ == '__main__':
     # Gather arguments
     inps = cmdParser()
 
+    # Use a non-interactive backend if the plot will not be displayed
+    if inps.noDisplay == True:
+        import matplotlib
+        matplotlib.use('Agg')
+
     # Instantiate object
-    M = mapShow(inps.imgFile, inps.imgType, inps.imgBand, inps.background, inps.verbose)
+    M = mapShow(inps.imgFile, inps.imgType, inps.imgBand, inps.background, inps.verbose,
+        inps.dfactor)
 
     # Plot image
-    M.plotImg(inps.dfactor,
-        inps.cmap, inps.cOrient,
+    M.plotImg(inps.cmap, inps.cOrient,
         inps.vmin, inps.vmax,
         inps.pctmin, inps.pctmax,
         inps.equalize)
@@ -381,4 +507,6 @@ if __name__ == '__main__':
     if inps.outName: M.saveMap(inps.outName, inps.outFmt)
 
     # Display
-    if inps.noDisplay == False: plt.show()
\ No newline at end of file
+    if inps.noDisplay == False:
+        import matplotlib.pyplot as plt
+        plt.show()
\ No newline at end of file
@@ -0,0 +1,126 @@
+'''
+Compiled per-pixel kernels for map viewing.
+Numba is optional; if it is not installed, equivalent NumPy versions are used.
+The compiled kernels live in numbaKernels, which is imported on first use so
+ that Numba is only loaded when a kernel is actually needed.
+'''
+
+### IMPORT MODULES ---
+import numpy as np
+try:
+    from fast_histogram import histogram1d
+except ImportError:
+    histogram1d = None
+
+
+### CONSTANTS ---
+# Number of histogram bins used to locate percentiles before exact selection
+nFineBins = 4096
+
+# Data types the kernels are compiled for
+kernelTypes = (np.float32, np.float64)
+
+# numbaKernels module, once loaded (False if Numba is not installed)
+_kernels = None
+
+
+### HELPERS ---
+def _getKernels():
+    '''
+    Import the Numba kernels on first use.
+    '''
+    global _kernels
+    if _kernels is None:
+        try:
+            import numbaKernels
+            _kernels = numbaKernels
+        except ImportError:
+            _kernels = False
+
+    return _kernels
+
+def _useKernel(arr):
+    '''
+    Check whether a compiled kernel is available for the array type.
+    '''
+    return arr.dtype in kernelTypes and _getKernels() is not False
+
+
+### BACKGROUND MASK ---
+def maskBackground(img, BGvals):
+    '''
+    Return the image as a masked array, masking NaN/inf and pixels equal to any
+     of the background values. The image data are not copied.
+    '''
+    BGvals = np.array(BGvals,
+        dtype=img.dtype if img.dtype.kind == 'f' else np.float64)
+
+    # With Numba, the kernel builds the mask in one pass and it is wrapped
+    #  without copying the data
+    if _useKernel(img) and img.ndim == 2:
+        return np.ma.array(img, mask=_kernels.maskBackgroundKernel(img, BGvals),
+            copy=False)
+
+    # Otherwise, build one boolean mask in place and wrap it once
+    mask = ~np.isfinite(img)
+    equal = np.empty(img.shape, dtype=bool)
+    for val in BGvals:
+        np.equal(img, val, out=equal)
+        mask |= equal
+
+    return np.ma.array(img, mask=mask, copy=False)
+
+
+### HISTOGRAM ---
+def histogramCounts(values, hmin, hmax, nbins):
+    '''
+    Count the values into nbins uniform bins spanning [hmin, hmax], including
+     hmax in the last bin.
+    An infinite range is left to np.histogram, which raises a ValueError.
+    '''
+    finiteRange = np.isfinite(hmin) and np.isfinite(hmax)
+
+    if finiteRange and _useKernel(values):
+        return _kernels.histogramKernel(values, float(hmin), float(hmax), int(nbins))
+
+    if finiteRange and histogram1d is not None:
+        # Uniform bins - direct index computation, no per-value search
+        #  (fast_histogram excludes the upper edge, so nudge it past max)
+        return histogram1d(values, bins=nbins,
+            range=(hmin, np.nextafter(hmax, np.inf)))
+
+    return np.histogram(values, bins=nbins, range=(hmin, hmax))[0]
+
+
+def valuePercentiles(values, pcts, hmin, hmax):
+    '''
+    Exact percentiles of the values, which span [hmin, hmax], taken as the
+     lower of the two neighboring ranks (np.percentile method='lower').
+    With Numba, one parallel histogram pass locates the bin holding each rank;
+     only the values in that bin are then gathered and partitioned. Otherwise,
+     np.percentile is applied to all values. Both give identical results.
+    '''
+    nValues = values.size
+    ranks = [int(pct/100*(nValues-1)) for pct in pcts]
+
+    if np.isfinite(hmin) and np.isfinite(hmax) and _useKernel(values):
+        hmin, hmax = float(hmin), float(hmax)
+        counts = _kernels.histogramKernel(values, hmin, hmax, nFineBins)
+        cdf = np.cumsum(counts)
+
+        # Every value must fall in a bin for the ranks to be located
+        if cdf[-1] == nValues:
+            pctVals = []
+            binValues = {}
+            for rank in ranks:
+                k = int(np.searchsorted(cdf, rank, side='right'))
+                if k not in binValues:
+                    binValues[k] = _kernels.binValuesKernel(values, hmin, hmax,
+                        nFineBins, k, counts[k])
+                rankInBin = rank - (cdf[k] - counts[k])
+                pctVals.append(np.partition(binValues[k], rankInBin)[rankInBin])
+
+            return np.array(pctVals)
+
+    return np.percentile(values, pcts, method='lower')
+
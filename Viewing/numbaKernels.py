@@ -0,0 +1,92 @@
+'''
+Numba kernels used by kernelFunctions.
+This module is only imported on the first call that needs a kernel, so that
+ importing kernelFunctions (and MapShow) does not load Numba. The kernels are
+ compiled for explicit float32/float64 signatures and cached to disk, so
+ compilation happens once rather than on every run.
+'''
+
+### IMPORT MODULES ---
+import numpy as np
+from numba import njit, prange, get_num_threads
+
+
+### BACKGROUND MASK ---
+@njit(['b1[:,:](f4[:,:], f4[:])', 'b1[:,:](f8[:,:], f8[:])'],
+    parallel=True, cache=True)
+def maskBackgroundKernel(img, BGvals):
+    '''
+    Single parallel pass over the image, testing each pixel for NaN/inf
+     and against every background value.
+    '''
+    M, N = img.shape
+    mask = np.empty((M, N), dtype=np.bool_)
+
+    for i in prange(M):
+        for j in range(N):
+            x = img[i,j]
+            masked = not np.isfinite(x)
+            for val in BGvals:
+                if x == val: masked = True
+            mask[i,j] = masked
+
+    return mask
+
+
+### HISTOGRAM ---
+def histogramKernel(values, hmin, hmax, nbins):
+    '''
+    Count the values into nbins uniform bins spanning [hmin, hmax], split
+     across the Numba threads.
+    '''
+    return _histogramChunks(values, hmin, hmax, nbins, get_num_threads())
+
+
+@njit(['i8[:](f4[:], f8, f8, i8, i8)', 'i8[:](f8[:], f8, f8, i8, i8)'],
+    parallel=True, cache=True)
+def _histogramChunks(values, hmin, hmax, nbins, nChunks):
+    '''
+    Single parallel pass over the values. Each chunk fills its own row of
+     counts, and the rows are summed at the end.
+    '''
+    nValues = values.size
+    chunkSize = (nValues + nChunks - 1)//nChunks
+    scale = nbins/(hmax - hmin) if hmax > hmin else 0.
+
+    counts = np.zeros((nChunks, nbins), dtype=np.int64)
+    for c in prange(nChunks):
+        for i in range(c*chunkSize, min((c+1)*chunkSize, nValues)):
+            x = values[i]
+            if not np.isfinite(x) or not (x >= hmin and x <= hmax): continue
+            k = int((x - hmin)*scale)
+            if k >= nbins: k = nbins - 1
+            counts[c,k] += 1
+
+    total = np.zeros(nbins, dtype=np.int64)
+    for c in range(nChunks):
+        total += counts[c]
+
+    return total
+
+
+@njit(['f4[:](f4[:], f8, f8, i8, i8, i8)', 'f8[:](f8[:], f8, f8, i8, i8, i8)'],
+    cache=True)
+def binValuesKernel(values, hmin, hmax, nbins, k, count):
+    '''
+    Gather the count values falling in bin k, binned exactly as in
+     _histogramChunks.
+    '''
+    scale = nbins/(hmax - hmin) if hmax > hmin else 0.
+
+    binValues = np.empty(count, dtype=values.dtype)
+    j = 0
+    for i in range(values.size):
+        x = values[i]
+        if not np.isfinite(x) or not (x >= hmin and x <= hmax): continue
+        b = int((x - hmin)*scale)
+        if b >= nbins: b = nbins - 1
+        if b == k:
+            binValues[j] = x
+            j += 1
+
+    return binValues